@@ -1,19 +1,26 @@
 import argparse
+import os
 import sys
+from collections import deque
 from sys import exit
-from copy import deepcopy
 
 def load_file(f):
-    """loads the level file f and returns it as two dimensional array;
-    ignores empty lines"""
-    with open(f, "r") as fp:
-        # only read nonempty lines
-        return [ list(l.replace("\n", "")) for l in fp if l and not l.startswith("#") ]
+    """loads the level file f and returns it as list of rows;
+    each row is a bytearray of the ascii codes of its characters;
+    ignores empty lines and comments"""
+    with open(f, "rb") as fp:
+        # only keep nonempty lines; splitlines also handles \r\n line endings like text mode did
+        return [ bytearray(l) for l in fp.read().splitlines() if l and not l.startswith(b"#") ]
 
 
 def to_str(s):
     """returns the level state s as string"""
-    return "\n".join([ "".join(l) for l in s ])
+    return b"\n".join(s).decode()
+
+
+def copy_state(s):
+    """returns an independent copy of the level state s"""
+    return [ bytearray(l) for l in s ]
 
 
 def print_state(s):
@@ -24,17 +31,25 @@ def print_state(s):
 def find_pos(s, x):
     """returns the positions at which character x is present in the level state s;
     positions are encoded as tuples of (row, col)"""
-    return [ (i, j) for i, l in enumerate(s) for j, c in enumerate(l) if c == x ]
+    b = ord(x)
+    p = []
+    for i, l in enumerate(s):
+        # let bytearray.find scan the row instead of comparing char by char
+        j = l.find(b)
+        while j != -1:
+            p.append((i, j))
+            j = l.find(b, j + 1)
+    return p
 
 
 def at_pos(s, i, j):
     """get the character at row i, col j in level state s"""
-    return s[i][j]
+    return chr(s[i][j])
 
 
 def set_at_pos(s, i, j, c):
     """set the character at row i, col j in level state s to c"""
-    s[i][j] = c
+    s[i][j] = ord(c)
     return s
 
 
@@ -69,6 +84,54 @@ _invalid = 1
 _unfinished = 2
 _defeated = 3
 _valid_chars = "G@YFMm_. xoWw"
+# precomputed forms of _valid_chars for validate_state; the string itself is kept for messages
+_valid_bytes = _valid_chars.encode()
+_valid_set = frozenset(_valid_chars)
+
+# (row, col) offset of a single step in each direction, see next_pos
+_dirs = { "h": (0, -1), "l": (0, 1), "k": (-1, 0), "j": (1, 0) }
+
+# characters ignored in command strings and files
+_whitespace = b" \t\r\n\v\f"
+
+# number of moves that can be undone in interactive mode
+_max_undo = 128
+
+# ascii codes of the level characters as stored in the level state
+_ram = ord("G")
+_victory_ram = ord("@")
+_defeated_ram = ord("Y")
+_flag = ord("F")
+_wall = ord("M")
+_damaged_wall = ord("m")
+_rubble = ord("_")
+_trail = ord(".")
+_blank = ord(" ")
+_trap = ord("x")
+_hole = ord("o")
+_heavy_weight = ord("W")
+_light_weight = ord("w")
+
+# kind of a level character as seen by move; indexed by ascii code, 0 => not accessible
+_kind_empty = 1
+_kind_wall = 2
+_kind_damaged_wall = 3
+_kind_flag = 4
+_kind_trap = 5
+_kind_hole = 6
+_kind_heavy_weight = 7
+_kind_light_weight = 8
+_kind = bytearray(256)
+_kind[_blank] = _kind_empty
+_kind[_rubble] = _kind_empty
+_kind[_trail] = _kind_empty
+_kind[_wall] = _kind_wall
+_kind[_damaged_wall] = _kind_damaged_wall
+_kind[_flag] = _kind_flag
+_kind[_trap] = _kind_trap
+_kind[_hole] = _kind_hole
+_kind[_heavy_weight] = _kind_heavy_weight
+_kind[_light_weight] = _kind_light_weight
 
 def validate_state(s):
     """returns the validity of the game state using the above exit codes;
@@ -79,37 +142,31 @@ def validate_state(s):
     victorious ram @ => victory
     defeated ram Y => defeat
     default => unfinished"""
-    length = len(s[0])
-    n = next(( (i, len(l)) for i, l in enumerate(s) if len(l) != length ), None)
+    # count characters, not bytes, so a non ascii char is reported as invalid char below
+    lengths = [ len(l.decode()) for l in s ]
+    length = lengths[0]
+    n = next(( (i, l) for i, l in enumerate(lengths) if l != length ), None)
     if n:
         i, l = n
         eprint(f"len(line {i}) = {l} != len(line 0) = {length}")
         eprint("all lines must have the same length")
         return _invalid
 
-    invalid = False
-    goat_count = 0
-    victory = False
-    defeated = False
-    finish_count = 0
-    for i, l in enumerate(s):
-        for j, c in enumerate(l):
-            if c not in _valid_chars:
-                eprint(f"invalid char {c} at row {i} col {j}")
-                eprint(f"all chars must be in {str(_valid_chars)}")
-                invalid = True
-            if c in "G":
-                goat_count += 1
-            elif c in "Y":
-                goat_count += 1
-                defeated = True
-            elif c in "@":
-                goat_count += 1
-                victory = True
-            elif c in "F":
-                finish_count += 1
-    if invalid:
+    # one flat buffer so every check below is a single pass in C
+    flat = b"".join(s)
+    # translate deletes all valid chars; whatever is left is invalid
+    if flat.translate(None, _valid_bytes):
+        for i, l in enumerate(s):
+            for j, c in enumerate(l.decode()):
+                if c not in _valid_set:
+                    eprint(f"invalid char {c} at row {i} col {j}")
+                    eprint(f"all chars must be in {str(_valid_chars)}")
         return _invalid
+
+    victory = flat.count(_victory_ram)
+    defeated = flat.count(_defeated_ram)
+    goat_count = flat.count(_ram) + victory + defeated
+    finish_count = flat.count(_flag)
     if not finish_count:
         eprint("found no F in file")
         eprint("file must contain at least 1")
@@ -125,93 +182,139 @@ def validate_state(s):
     return _unfinished
 
 
-def move(s, dir):
+def move(s, dir, pos=None):
     """move ram in dir on level state s;
+    pos is the (row, col) of the ram G if known, otherwise s is searched for it;
+    returns a tuple of the exit code and the position of G after the move (None if there is no G left);
     this is the core game logic"""
 
     # find the initial position of the ram
     height, width = bounds(s)
-    p = find_pos(s, "G")
-    if not p:
-        if find_pos(s, "@"):
-            return _victory
-        elif find_pos(s, "Y"):
-            return _defeated
-        else:
-            return _invalid
-    row, col = p[0]
-
-    # move until obstacle is reached
+    if pos is None:
+        p = find_pos(s, "G")
+        if not p:
+            if find_pos(s, "@"):
+                return _victory, None
+            elif find_pos(s, "Y"):
+                return _defeated, None
+            else:
+                return _invalid, None
+        pos = p[0]
+    row, col = pos
+    # resolve the direction once instead of calling next_pos on every step
+    dr, dc = _dirs[dir]
+
+    # move until obstacle is reached;
+    # cells are read and written as ascii codes to skip the at_pos/set_at_pos conversions
     while True:
-        next_row, next_col = next_pos(row, col, dir)
+        next_row, next_col = row + dr, col + dc
 
         # reached level bounds => stop
-        if not in_bounds(height, width, next_row, next_col):
-            return _unfinished
-        c = at_pos(s, next_row, next_col)
+        if not (0 <= next_row < height and 0 <= next_col < width):
+            return _unfinished, (row, col)
+        c = s[next_row][next_col]
+        k = _kind[c]
         # empty field => move through
-        if c in " _.":
-            set_at_pos(s, next_row, next_col, "G")
-            set_at_pos(s, row, col, ".")
+        if k == _kind_empty:
+            s[next_row][next_col] = _ram
+            s[row][col] = _trail
             row, col = next_row, next_col
         # wall => damage it and stop
-        elif c in "M":
-            set_at_pos(s, next_row, next_col, "m")
-            return _unfinished
+        elif k == _kind_wall:
+            s[next_row][next_col] = _damaged_wall
+            return _unfinished, (row, col)
         # damaged wall => destroy it and stop
-        elif c in "m":
-            set_at_pos(s, next_row, next_col, "_")
-            return _unfinished
+        elif k == _kind_damaged_wall:
+            s[next_row][next_col] = _rubble
+            return _unfinished, (row, col)
         # finish flag => change to victory ram and stop
-        elif c in "F":
-            set_at_pos(s, row, col, "@")
-            return _victory
+        elif k == _kind_flag:
+            s[row][col] = _victory_ram
+            return _victory, None
         # trap => stop and die
-        elif c in "x":
-            set_at_pos(s, row, col, "Y")
-            return _defeated
+        elif k == _kind_trap:
+            s[row][col] = _defeated_ram
+            return _defeated, None
         # hole => stop and implicitly remove hole
-        elif c in "o":
-            set_at_pos(s, next_row, next_col, "G")
-            set_at_pos(s, row, col, ".")
-            return _unfinished
+        elif k == _kind_hole:
+            s[next_row][next_col] = _ram
+            s[row][col] = _trail
+            return _unfinished, (next_row, next_col)
         # heavy weight => push it one field; remove it when it moves on a hole; destroy traps on its path
-        elif c in "W":
-            over_row, over_col = next_pos(next_row, next_col, dir)
-            if not in_bounds(height, width, over_row, over_col):
-                return _unfinished
-            nc = at_pos(s, over_row, over_col)
-            if nc in " _.x":
-                set_at_pos(s, over_row, over_col, "W")
-                set_at_pos(s, next_row, next_col, "G")
-                set_at_pos(s, row, col, ".")
-            elif nc in "o":
-                set_at_pos(s, over_row, over_col, "_")
-                set_at_pos(s, next_row, next_col, "G")
-                set_at_pos(s, row, col, ".")
-            return _unfinished
+        elif k == _kind_heavy_weight:
+            over_row, over_col = next_row + dr, next_col + dc
+            if not (0 <= over_row < height and 0 <= over_col < width):
+                return _unfinished, (row, col)
+            nk = _kind[s[over_row][over_col]]
+            if nk == _kind_empty or nk == _kind_trap:
+                s[over_row][over_col] = _heavy_weight
+            elif nk == _kind_hole:
+                s[over_row][over_col] = _rubble
+            else:
+                return _unfinished, (row, col)
+            s[next_row][next_col] = _ram
+            s[row][col] = _trail
+            return _unfinished, (next_row, next_col)
         # heavy weight => push it until it reaches an obstacle; remove it when it moves on a hole; destroy traps on its path
-        elif c in "w":
-            row, col = next_row, next_col
+        elif k == _kind_light_weight:
+            w_row, w_col = next_row, next_col
             while True:
-                next_row, next_col = next_pos(row, col, dir)
-                if not in_bounds(height, width, next_row, next_col):
+                next_row, next_col = w_row + dr, w_col + dc
+                if not (0 <= next_row < height and 0 <= next_col < width):
                     break
-                nc = at_pos(s, next_row, next_col)
-                if nc in " _.x":
-                    set_at_pos(s, row, col, " ")
-                    set_at_pos(s, next_row, next_col, "w")
-                    row, col = next_row, next_col
-                elif nc in "o":
-                    set_at_pos(s, row, col, " ")
-                    set_at_pos(s, next_row, next_col, "_")
+                nk = _kind[s[next_row][next_col]]
+                if nk == _kind_empty or nk == _kind_trap:
+                    s[w_row][w_col] = _blank
+                    s[next_row][next_col] = _light_weight
+                    w_row, w_col = next_row, next_col
+                elif nk == _kind_hole:
+                    s[w_row][w_col] = _blank
+                    s[next_row][next_col] = _rubble
                     break
                 else:
                     break
-            return _unfinished
+            return _unfinished, (row, col)
         else:
-            eprint(f"invalid level character {c}")
-            return _invalid
+            eprint(f"invalid level character {chr(c)}")
+            return _invalid, (row, col)
+
+
+def run(s, instr):
+    """execute the directional commands instr on level state s;
+    instr must only contain [hjkl]; stops as soon as the game is decided;
+    returns the exit code of the last move"""
+    e_code = _unfinished
+    pos = None
+    for dir in instr:
+        e_code, pos = move(s, dir, pos)
+        if e_code != _unfinished:
+            break
+    return e_code
+
+
+def save_path(s, pos, dir):
+    """returns the part of level state s that a move of the ram at pos in dir can change;
+    that is the row of pos for [hl] and its column for [jk];
+    encoded as tuple of (row, col, saved) where the unused index is None;
+    returns None if pos is None since then move changes nothing"""
+    if pos is None:
+        return None
+    row, col = pos
+    if dir in "hl":
+        return row, None, bytes(s[row])
+    return None, col, bytes(l[col] for l in s)
+
+
+def restore_path(s, path):
+    """undo the changes to level state s since path was saved by save_path"""
+    if path is None:
+        return
+    row, col, saved = path
+    if col is None:
+        s[row][:] = saved
+    else:
+        for l, c in zip(s, saved):
+            l[col] = c
 
 
 def print_help():
@@ -279,29 +382,32 @@ if __name__ == '__main__':
             print_state(s)
         exit(e_code)
 
-    instr = ""
+    instr = None
     if args.f:
-        with open(args.f, "r") as f:
-            instr = "".join(( l.strip() for l in f if l.strip() ))
+        with open(args.f, "rb") as f:
+            # a file without any commands starts interactive mode
+            instr = f.read().translate(None, _whitespace) or None
     elif args.e:
-        instr = args.e
+        instr = os.fsencode(args.e).translate(None, _whitespace)
 
     # non interactive mode
-    if instr:
-        for dir in instr:
-            if dir in " \t\n":
-                continue
-            if dir not in "hjkl":
-                eprint(f"invalid input {dir}")
-                exit(_invalid)
-            e_code = move(s, dir)
-            if e_code != _unfinished:
-                break
+    if instr is not None:
+        # translate deletes all valid commands; whatever is left is invalid
+        bad = instr.translate(None, b"hjkl")
+        if bad:
+            eprint(f"invalid input {os.fsdecode(bad)[0]}")
+            exit(_invalid)
+        instr = instr.decode()
+        e_code = run(s, instr)
         tear_down(s, args)
         exit(e_code)
 
-    state_history = [deepcopy(s)]
+    # restarts copy this instead of loading the level file again
+    initial = copy_state(s)
+    # per move the ram position before it and the path it changed, see save_path
+    state_history = deque(maxlen=_max_undo)
     command_history = ""
+    pos = None
     # interactive mode
     print_state(s)
     while True:
@@ -310,21 +416,28 @@ if __name__ == '__main__':
             continue
         for d in dirs:
             if d in "hjkl":
-                e_code = move(s, d)
-                state_history.append(deepcopy(s))
+                if pos is None:
+                    p = find_pos(s, "G")
+                    pos = p[0] if p else None
+                state_history.append((pos, save_path(s, pos, d)))
+                e_code, pos = move(s, d, pos)
                 command_history = command_history + d
             elif d == "q":
                 tear_down(s, args)
                 exit(e_code)
             elif d in "rU":
-                s = load_file(args.file)
-                state_history = [ deepcopy(s) ]
+                s = copy_state(initial)
+                state_history.clear()
                 command_history = ""
+                pos = None
             elif d == "u":
-                if command_history:
-                    del state_history[-1]
+                if state_history:
+                    pos, path = state_history.pop()
+                    restore_path(s, path)
                     command_history = command_history[:-1]
-                    s = state_history[-1]
+                # older moves have been dropped from the history and can no longer be undone
+                elif command_history:
+                    print(f"cannot undo more than {_max_undo} moves")
             else:
                 print_help()
             print("-" * len(s[0]))